@@ -1,7 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, make_response, send_file, Response, stream_with_context, g, abort, has_request_context
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timedelta, timezone
+import atexit
+import functools
+import hashlib
 import json
 import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from pathlib import Path
 from twilio.rest import Client
@@ -15,10 +26,42 @@ import cv2
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'   
  
-DATA_DIR = Path(__file__).parent / 'data'
+DATA_DIR = Path(os.environ.get('INVENTORY_DATA_DIR', Path(__file__).parent / 'data'))
 DATA_FILE = DATA_DIR / 'products.json'
 SETTINGS_FILE = DATA_DIR / 'settings.json'
 CONFIG_FILE = DATA_DIR / 'config.json'
+INVENTORY_META_FILE = DATA_DIR / 'inventory_meta.json'
+
+# Seconds between keep-alive comments on the /events stream
+EVENTS_HEARTBEAT_SECONDS = 15
+# Pending change events buffered per /events client before it has to resync
+EVENTS_QUEUE_SIZE = 100
+# Changes kept in memory for /api/changes; older clients get a full resync
+CHANGE_LOG_SIZE = 1000
+
+# Why stock moved; quantity changes default to sale/restock, deletes to
+# expired (past expiry date) or waste
+MOVEMENT_REASONS = ('sale', 'waste', 'restock', 'expired')
+# Ledger marker (with delta 0) for a deleted product: ids are reused, so its
+# per-product history must not carry over to the next product with that id
+PRODUCT_DELETED = 'deleted'
+# Days of movement rollups kept (and the longest analytics window)
+ROLLUP_RETENTION_DAYS = 365
+
+# Cache lifetime for content-addressed product images (they never change)
+IMAGE_CACHE_SECONDS = 365 * 24 * 3600
+# How long shutdown waits for queued thumbnail jobs
+IMAGE_WORKER_SHUTDOWN_SECONDS = 10
+# Scans no product references are removed once they are this old...
+UNREFERENCED_IMAGE_HOURS = 24
+# ...by a sweep that runs at most this often (and via `flask prune-images`)
+IMAGE_PRUNE_INTERVAL_SECONDS = 3600
+
+# Location served at the un-prefixed URLs, stored in data/products.json
+DEFAULT_LOCATION = 'main'
+LOCATION_SLUG = re.compile(r'[a-z0-9](?:[a-z0-9-]{0,38}[a-z0-9])?')
+# Threads used to scan location shards in parallel (alerts, search)
+SHARD_WORKERS = int(os.environ.get('INVENTORY_SHARD_WORKERS', 8))
 
 # Ensure data directory exists
 DATA_DIR.mkdir(exist_ok=True)
@@ -34,6 +77,31 @@ DEFAULT_SETTINGS = {
     #'openrouter_api_key': 'Get Bot token from the open router model : mistral 7b instruct '
 }
 
+# External service endpoints (overridable so local stand-ins can be used)
+OPENROUTER_API_URL = os.environ.get('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1/chat/completions')
+TWILIO_API_URL = os.environ.get('TWILIO_API_URL')
+
+# Concurrency limits per endpoint class (overridable under 'bulkheads' in
+# config.json): requests running at once, requests allowed to wait for a
+# slot, seconds they wait, and the Retry-After sent when a class is full
+DEFAULT_BULKHEADS = {
+    'read': {'max_in_flight': 16, 'queue_size': 16, 'queue_timeout': 1, 'retry_after': 1},
+    'crud': {'max_in_flight': 8, 'queue_size': 8, 'queue_timeout': 2, 'retry_after': 1},
+    'ai': {'max_in_flight': 4, 'queue_size': 4, 'queue_timeout': 5, 'retry_after': 10},
+    'ocr': {'max_in_flight': 2, 'queue_size': 2, 'queue_timeout': 10, 'retry_after': 10},
+    'stream': {'max_in_flight': 32, 'queue_size': 0, 'queue_timeout': 0, 'retry_after': 30},
+}
+
+# Production server (serve.py), overridable under 'server' in config.json;
+# threads=None sizes the pool from the bulkheads
+DEFAULT_SERVER = {
+    'host': '0.0.0.0',
+    'port': 5000,
+    'threads': None,
+    'connection_limit': 1000,
+    'channel_timeout': 120
+}
+
 # Twilio configuration
 DEFAULT_CONFIG = {
     #'account_sid': 'account sid ',
@@ -67,43 +135,693 @@ def save_settings(settings):
     except IOError:
         return False
 
-def load_products():
-    if DATA_FILE.exists():
+def parse_product_dates(product):
+    product['manufacture_date'] = datetime.strptime(product['manufacture_date'], '%Y-%m-%d').date()
+    product['expiry_date'] = datetime.strptime(product['expiry_date'], '%Y-%m-%d').date()
+    product['added_date'] = datetime.strptime(product['added_date'], '%Y-%m-%d').date()
+    return product
+
+# Locations. The default location keeps using data/products.json; every
+# other location is a shard with its own products.json (and version state)
+# under data/locations/<slug>/.
+def locations_dir():
+    return DATA_DIR / 'locations'
+
+def is_valid_location(location):
+    return bool(LOCATION_SLUG.fullmatch(location or ''))
+
+def location_exists(location):
+    if location == DEFAULT_LOCATION:
+        return True
+    return is_valid_location(location) and (locations_dir() / location).is_dir()
+
+def list_locations():
+    locations = [DEFAULT_LOCATION]
+    if locations_dir().is_dir():
+        locations += sorted(p.name for p in locations_dir().iterdir()
+                            if p.is_dir() and is_valid_location(p.name) and p.name != DEFAULT_LOCATION)
+    return locations
+
+def create_location(name):
+    """Create a location from a display name and return its slug."""
+    location = re.sub(r'[^a-z0-9]+', '-', name.strip().lower()).strip('-')[:40].strip('-')
+    if not is_valid_location(location):
+        raise ValueError("Location name must contain letters or digits")
+    if location != DEFAULT_LOCATION:
+        (locations_dir() / location).mkdir(parents=True, exist_ok=True)
+    return location
+
+def current_location():
+    if has_request_context():
+        return getattr(g, 'location', DEFAULT_LOCATION)
+    return DEFAULT_LOCATION
+
+class MovementLedger:
+    """Append-only stock movements of one location plus daily rollups.
+    
+    Each quantity change or delete appends ``[timestamp, product id, delta,
+    reason]`` to movements.jsonl, and a delete also appends a PRODUCT_DELETED
+    marker. Per-day and per-product/per-day unit totals
+    are kept up to date incrementally in movement_rollups.json (with the
+    ledger offset they cover), so analytics only ever sum a bounded window of
+    days instead of replaying the ledger. Callers hold the store's lock."""
+    
+    def __init__(self, store):
+        self.store = store
+        self.rollups = None
+    
+    @property
+    def ledger_file(self):
+        return self.store.directory / 'movements.jsonl'
+    
+    @property
+    def rollups_file(self):
+        return self.store.directory / 'movement_rollups.json'
+    
+    def record(self, movements):
+        """Append ``(product_id, delta, reason)`` movements and roll them up."""
+        if not movements:
+            return
+        self._ensure_rollups()
+        now = datetime.now()
+        lines = [json.dumps([int(now.timestamp()), product_id, delta, reason]) + '\n'
+                 for product_id, delta, reason in movements]
         try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                products = []
-                for product in data:
-                    try:
-                        product['manufacture_date'] = datetime.strptime(product['manufacture_date'], '%Y-%m-%d').date()
-                        product['expiry_date'] = datetime.strptime(product['expiry_date'], '%Y-%m-%d').date()
-                        product['added_date'] = datetime.strptime(product['added_date'], '%Y-%m-%d').date()
-                        products.append(product)
-                    except (KeyError, ValueError):
-                        continue
-                return products
-        except (json.JSONDecodeError, IOError):
-            return []
-    return []
+            with open(self.ledger_file, 'a') as f:
+                f.writelines(lines)
+                offset = f.tell()
+        except IOError as e:
+            print(f"Failed to write stock movements: {e}")
+            return
+        for product_id, delta, reason in movements:
+            self._roll_up(now.date(), product_id, delta, reason)
+        self.rollups['offset'] = offset
+        self._prune(now.date())
+        self._save_rollups()
+    
+    def window_totals(self, days):
+        """Units per reason over the last ``days`` days (today included)."""
+        self._ensure_rollups()
+        totals = dict.fromkeys(MOVEMENT_REASONS, 0)
+        for day in self._window(days):
+            for reason, units in self.rollups['days'].get(day, {}).items():
+                totals[reason] += units
+        return totals
+    
+    def daily_totals(self, days):
+        self._ensure_rollups()
+        return [{'date': day, **dict.fromkeys(MOVEMENT_REASONS, 0), **self.rollups['days'].get(day, {})}
+                for day in self._window(days)]
+    
+    def average_daily_consumption(self, product_id, days):
+        """Units sold per day over the last ``days`` days, counted from the
+        product's first movement if that is more recent."""
+        self._ensure_rollups()
+        product = self.rollups['products'].get(str(product_id))
+        if not product:
+            return 0.0
+        today = datetime.now().date()
+        tracked = (today - datetime.strptime(product['first_day'], '%Y-%m-%d').date()).days + 1
+        window = max(1, min(days, tracked))
+        sold = sum(product['days'].get(day, {}).get('sale', 0) for day in self._window(window))
+        return sold / window
+    
+    def _window(self, days):
+        today = datetime.now().date()
+        return [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+    
+    def _roll_up(self, day, product_id, delta, reason):
+        if reason == PRODUCT_DELETED:
+            self.rollups['products'].pop(str(product_id), None)
+            return
+        day = day.isoformat()
+        units = abs(delta)
+        day_totals = self.rollups['days'].setdefault(day, {})
+        day_totals[reason] = day_totals.get(reason, 0) + units
+        product = self.rollups['products'].setdefault(str(product_id), {'first_day': day, 'days': {}})
+        product_day = product['days'].setdefault(day, {})
+        product_day[reason] = product_day.get(reason, 0) + units
+    
+    def _prune(self, today):
+        cutoff = (today - timedelta(days=ROLLUP_RETENTION_DAYS)).isoformat()
+        if min(self.rollups['days'], default=cutoff) >= cutoff:
+            return
+        self.rollups['days'] = {d: v for d, v in self.rollups['days'].items() if d >= cutoff}
+        for product in self.rollups['products'].values():
+            product['days'] = {d: v for d, v in product['days'].items() if d >= cutoff}
+        self.rollups['products'] = {product_id: product for product_id, product in self.rollups['products'].items()
+                                    if product['days']}
+    
+    def _ensure_rollups(self):
+        """Load the rollups, catching up on ledger lines they don't cover yet
+        (e.g. after a crash between the two writes or a deleted rollup file)."""
+        if self.rollups is None:
+            self.rollups = {'offset': 0, 'days': {}, 'products': {}}
+            if self.rollups_file.exists():
+                try:
+                    with open(self.rollups_file, 'r') as f:
+                        self.rollups = json.load(f)
+                except (json.JSONDecodeError, IOError):
+                    pass
+        try:
+            size = self.ledger_file.stat().st_size
+        except OSError:
+            return
+        if size == self.rollups['offset']:
+            return
+        if size < self.rollups['offset']:
+            self.rollups = {'offset': 0, 'days': {}, 'products': {}}
+        
+        with open(self.ledger_file, 'r') as f:
+            f.seek(self.rollups['offset'])
+            for line in f:
+                try:
+                    timestamp, product_id, delta, reason = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                self._roll_up(datetime.fromtimestamp(timestamp).date(), product_id, delta, reason)
+            self.rollups['offset'] = f.tell()
+        self._prune(datetime.now().date())
+        self._save_rollups()
+    
+    def _save_rollups(self):
+        try:
+            with open(self.rollups_file, 'w') as f:
+                json.dump(self.rollups, f)
+        except IOError:
+            pass
 
-def save_products(products_list):
-    serializable_products = []
-    for product in products_list:
+class InventoryStore:
+    """Products of one location, with their version tracking.
+    
+    Every save bumps a monotonically increasing version (persisted next to the
+    data), stamps it on the rows it changed, appends the change to a bounded
+    in-memory log for /api/changes and publishes it to /events subscribers;
+    the dashboard and listing use it for their ETags. The lock is re-entrant
+    so sync requests can check and save atomically."""
+    
+    def __init__(self, location):
+        self.location = location
+        self.lock = threading.RLock()
+        self.state = {}
+        self.change_log = deque(maxlen=CHANGE_LOG_SIZE)
+        self.ledger = MovementLedger(self)
+    
+    # Paths are resolved on every access so DATA_DIR/DATA_FILE can be repointed
+    @property
+    def directory(self):
+        if self.location == DEFAULT_LOCATION:
+            return DATA_DIR
+        return locations_dir() / self.location
+    
+    @property
+    def data_file(self):
+        if self.location == DEFAULT_LOCATION:
+            return DATA_FILE
+        return self.directory / 'products.json'
+    
+    @property
+    def meta_file(self):
+        if self.location == DEFAULT_LOCATION:
+            return INVENTORY_META_FILE
+        return self.directory / 'inventory_meta.json'
+    
+    def load(self):
+        data_file = self.data_file
+        if data_file.exists():
+            try:
+                with open(data_file, 'r') as f:
+                    data = json.load(f)
+                    products = []
+                    for product in data:
+                        try:
+                            products.append(parse_product_dates(product))
+                        except (KeyError, ValueError):
+                            continue
+                    return products
+            except (json.JSONDecodeError, IOError):
+                return []
+        return []
+    
+    def save(self, products_list, reasons=None):
+        """Write the products. ``reasons`` maps product ids to the movement
+        reason for their quantity change; unlisted changes get a default."""
+        serializable_products = []
+        for product in products_list:
+            try:
+                serialized = product.copy()
+                serialized['manufacture_date'] = product['manufacture_date'].isoformat()
+                serialized['expiry_date'] = product['expiry_date'].isoformat()
+                serialized['added_date'] = product['added_date'].isoformat()
+                serializable_products.append(serialized)
+            except (KeyError, AttributeError):
+                continue
+        
+        with self.lock:
+            self._sync()
+            changed, deleted = self._stamp_changed_rows(serializable_products)
+            # Write aside and swap in, so unlocked readers never see a partial file
+            data_file = self.data_file
+            temp_file = data_file.with_name(f"{data_file.name}.{threading.get_ident()}.tmp")
+            try:
+                with open(temp_file, 'w') as f:
+                    json.dump(serializable_products, f, indent=2)
+                os.replace(temp_file, data_file)
+            except IOError:
+                return False
+            self.ledger.record(self._movements(changed, deleted, reasons or {}))
+            self._record_change(serializable_products, changed, deleted)
+        return True
+    
+    def version(self):
+        """Return (version, updated_at) of this location's inventory."""
+        with self.lock:
+            self._sync()
+            return self.state['version'], self.state['updated_at']
+    
+    def rows(self):
+        """Stored rows (string dates, with versions) keyed by product id."""
+        with self.lock:
+            self._sync()
+            return self.state['rows']
+    
+    def changes_since(self, since):
+        """Net product changes after version ``since``.
+        
+        Returns a dict with the current ``version`` and either ``changed`` rows
+        and ``deleted`` ids, or ``full: True`` with every product when the
+        change log no longer reaches back that far (or the data was replaced
+        wholesale)."""
+        with self.lock:
+            self._sync()
+            version = self.state['version']
+            if since == version:
+                return {'version': version, 'full': False, 'changed': [], 'deleted': []}
+            
+            entries = [entry for entry in self.change_log if entry['version'] > since]
+            complete = (0 <= since < version and entries
+                        and entries[0]['version'] == since + 1
+                        and not any(entry.get('reload') for entry in entries))
+            if not complete:
+                return {'version': version, 'full': True,
+                        'changed': list(self.state['rows'].values()), 'deleted': []}
+            
+            changed = {}
+            deleted = set()
+            for entry in entries:
+                for row in entry['changed']:
+                    changed[row['id']] = row
+                    deleted.discard(row['id'])
+                for product_id in entry['deleted']:
+                    changed.pop(product_id, None)
+                    deleted.add(product_id)
+            return {'version': version, 'full': False,
+                    'changed': list(changed.values()), 'deleted': sorted(deleted)}
+    
+    def _data_file_mtime(self):
         try:
-            serialized = product.copy()
-            serialized['manufacture_date'] = product['manufacture_date'].isoformat()
-            serialized['expiry_date'] = product['expiry_date'].isoformat()
-            serialized['added_date'] = product['added_date'].isoformat()
-            serializable_products.append(serialized)
-        except (KeyError, AttributeError):
-            continue
+            return self.data_file.stat().st_mtime_ns
+        except OSError:
+            return None
     
+    def _read_raw_products(self):
+        try:
+            with open(self.data_file, 'r') as f:
+                return {p['id']: p for p in json.load(f) if isinstance(p, dict) and 'id' in p}
+        except (json.JSONDecodeError, IOError, TypeError):
+            return {}
+    
+    def _save_meta(self):
+        try:
+            with open(self.meta_file, 'w') as f:
+                json.dump({
+                    'version': self.state['version'],
+                    'updated_at': self.state['updated_at'].isoformat(),
+                    'mtime': self.state['mtime']
+                }, f)
+        except IOError:
+            pass
+    
+    def _bump_version(self):
+        self.state['version'] += 1
+        self.state['updated_at'] = datetime.now(timezone.utc).replace(microsecond=0)
+        self.state['mtime'] = self._data_file_mtime()
+        self._save_meta()
+        return self.state['version']
+    
+    def _sync(self):
+        """Load the version state on first use and resync it if products.json
+        was changed by something other than save(). Caller holds the lock."""
+        data_file = self.data_file
+        mtime = self._data_file_mtime()
+        if self.state.get('path') == data_file and self.state.get('mtime') == mtime:
+            return
+        
+        if self.state.get('path') != data_file:
+            meta = {}
+            if self.meta_file.exists():
+                try:
+                    with open(self.meta_file, 'r') as f:
+                        meta = json.load(f)
+                    meta['version'] = int(meta['version'])
+                    meta['updated_at'] = datetime.fromisoformat(meta['updated_at'])
+                except (json.JSONDecodeError, IOError, KeyError, ValueError):
+                    meta = {}
+            self.state.update({
+                'path': data_file,
+                'version': meta.get('version', 0),
+                'updated_at': meta.get('updated_at') or datetime.now(timezone.utc).replace(microsecond=0),
+                'mtime': meta.get('mtime')
+            })
+        
+        self.state['rows'] = self._read_raw_products()
+        if self.state['mtime'] != mtime:
+            # Edited by hand or by another process: we can't tell what changed
+            version = self._bump_version()
+            self._log_change({'version': version, 'reload': True})
+    
+    def _stamp_changed_rows(self, serializable_products):
+        """Diff rows against the last saved state and stamp the upcoming
+        version on the changed ones. Returns (changed rows, deleted ids)."""
+        previous = self.state['rows']
+        next_version = self.state['version'] + 1
+        changed = []
+        seen = set()
+        for row in serializable_products:
+            seen.add(row['id'])
+            old = previous.get(row['id'])
+            # Carry the stored version over so only real edits count as changes
+            if old is not None and 'version' in old:
+                row['version'] = old['version']
+            else:
+                row.pop('version', None)
+            if old != row:
+                row['version'] = next_version
+                changed.append(row)
+        deleted = [product_id for product_id in previous if product_id not in seen]
+        return changed, deleted
+    
+    def _movements(self, changed, deleted, reasons):
+        """Quantity deltas between the stored rows and a save."""
+        previous = self.state['rows']
+        today = datetime.now().date().isoformat()
+        movements = []
+        for row in changed:
+            old = previous.get(row['id'])
+            delta = _quantity(row) - (_quantity(old) if old else 0)
+            if delta:
+                default = 'restock' if delta > 0 else 'sale'
+                movements.append((row['id'], delta, _movement_reason(reasons.get(row['id']), default)))
+        for product_id in deleted:
+            old = previous[product_id]
+            if _quantity(old) > 0:
+                default = 'expired' if str(old.get('expiry_date', '')) < today else 'waste'
+                movements.append((product_id, -_quantity(old), _movement_reason(reasons.get(product_id), default)))
+            movements.append((product_id, 0, PRODUCT_DELETED))
+        return movements
+    
+    def _record_change(self, serializable_products, changed, deleted):
+        self.state['rows'] = {p['id']: p for p in serializable_products}
+        if not changed and not deleted:
+            self.state['mtime'] = self._data_file_mtime()
+            self._save_meta()
+            return
+        
+        version = self._bump_version()
+        self._log_change({'version': version, 'changed': changed, 'deleted': deleted})
+    
+    def _log_change(self, event):
+        self.change_log.append(event)
+        publish_inventory_event(self.location, event)
+
+def _quantity(row):
     try:
-        with open(DATA_FILE, 'w') as f:
-            json.dump(serializable_products, f, indent=2)
-        return True
-    except IOError:
-        return False
+        return int(row.get('quantity', 0))
+    except (TypeError, ValueError):
+        return 0
+
+def _movement_reason(reason, default):
+    return reason if reason in MOVEMENT_REASONS else default
+
+stores = {}
+stores_lock = threading.Lock()
+event_subscribers = []
+
+def get_store(location=None):
+    location = location or current_location()
+    with stores_lock:
+        if location not in stores:
+            stores[location] = InventoryStore(location)
+        return stores[location]
+
+def load_products(location=None):
+    return get_store(location).load()
+
+def save_products(products_list, location=None, reasons=None):
+    return get_store(location).save(products_list, reasons)
+
+def get_inventory_version(location=None):
+    """Return (version, updated_at) of a location's inventory."""
+    return get_store(location).version()
+
+def get_changes_since(since, location=None):
+    return get_store(location).changes_since(since)
+
+def publish_inventory_event(location, event):
+    for subscribed_location, subscriber in list(event_subscribers):
+        if subscribed_location != location:
+            continue
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            # The client notices the version gap on its next event and reloads
+            pass
+
+def predict_expiry_waste(location=None, days=30):
+    """Products expected to expire before they are used up.
+    
+    Projects each product's average daily sales over the last ``days`` days
+    (from the movement rollups) forward to its expiry date; whatever would be
+    left over is at risk."""
+    store = get_store(location)
+    today = datetime.now().date()
+    at_risk = []
+    with store.lock:
+        for product in store.load():
+            days_left = (product['expiry_date'] - today).days
+            quantity = _quantity(product)
+            if days_left < 0 or quantity <= 0:
+                continue
+            rate = store.ledger.average_daily_consumption(product['id'], days)
+            leftover = quantity - rate * days_left
+            if leftover <= 0:
+                continue
+            at_risk.append({
+                'id': product['id'],
+                'name': product['name'],
+                'quantity': quantity,
+                'unit': product['unit'],
+                'expiry_date': product['expiry_date'].isoformat(),
+                'days_left': days_left,
+                'avg_daily_consumption': round(rate, 2),
+                'days_to_use_up': round(quantity / rate, 1) if rate else None,
+                'projected_leftover': round(leftover, 1)
+            })
+    return sorted(at_risk, key=lambda p: (p['days_left'], -p['projected_leftover']))
+
+def search_products(query, locations=None):
+    """Search every location's shard in parallel and merge the results.
+    Each product comes back with urgency details and its ``location``."""
+    query = query.lower()
+    locations = locations or list_locations()
+    
+    def search_shard(location):
+        return [{**with_urgency(p), 'location': location}
+                for p in load_products(location) if query in p['name'].lower()]
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(SHARD_WORKERS, len(locations)))) as pool:
+        results = [p for shard in pool.map(search_shard, locations) for p in shard]
+    return sort_by_urgency(results)
+
+# Product images. Originals are stored content-addressed (named by their
+# SHA-256, so identical scans are only stored once) under data/images/, and a
+# background worker renders the downscaled thumbnail and WebP variants.
+# Being immutable, every variant is served with a year-long cache lifetime.
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'jpg',
+    b'\x89PNG\r\n\x1a\n': 'png',
+}
+IMAGE_VARIANTS = {
+    # name: (longest side in pixels, extension, encoder params)
+    'thumb.jpg': (160, 'jpg', [cv2.IMWRITE_JPEG_QUALITY, 80]),
+    'thumb.webp': (160, 'webp', [cv2.IMWRITE_WEBP_QUALITY, 75]),
+    'medium.webp': (800, 'webp', [cv2.IMWRITE_WEBP_QUALITY, 80]),
+}
+IMAGE_DIGEST = re.compile(r'[0-9a-f]{64}')
+
+image_jobs = queue.Queue()
+image_worker_lock = threading.Lock()
+image_worker = None
+# Worker job that sweeps unreferenced images instead of rendering variants
+PRUNE_IMAGES_JOB = 'prune'
+last_image_prune = None
+
+def images_dir():
+    return DATA_DIR / 'images'
+
+def _image_extension(image_bytes):
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if image_bytes.startswith(signature):
+            return extension
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def _image_path(digest, name):
+    return images_dir() / digest[:2] / f"{digest}-{name}"
+
+def original_image_path(digest):
+    if not IMAGE_DIGEST.fullmatch(digest or ''):
+        return None
+    for extension in ('jpg', 'png', 'webp'):
+        path = _image_path(digest, f"original.{extension}")
+        if path.exists():
+            return path
+    return None
+
+def image_exists(digest):
+    return original_image_path(digest) is not None
+
+def store_image(image_bytes):
+    """Store an image by content hash and queue its variants.
+    Returns the digest, or None if the bytes aren't a JPEG/PNG/WebP image."""
+    extension = _image_extension(image_bytes)
+    if not extension:
+        return None
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    path = _image_path(digest, f"original.{extension}")
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(temp_path, path)
+        except IOError as e:
+            print(f"Failed to store image: {e}")
+            return None
+    else:
+        # A rescan restarts the clock for pruning it while unattached
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    queue_image_variants(digest)
+    schedule_image_prune()
+    return digest
+
+def _queue_image_job(job):
+    global image_worker
+    with image_worker_lock:
+        if image_worker is None or not image_worker.is_alive():
+            image_worker = threading.Thread(target=_image_worker_loop, name='image-variants', daemon=True)
+            image_worker.start()
+    image_jobs.put(job)
+
+def queue_image_variants(digest):
+    if all(_image_path(digest, name).exists() for name in IMAGE_VARIANTS):
+        return
+    _queue_image_job(digest)
+
+def schedule_image_prune():
+    """Queue a sweep of unreferenced images if the last one is old enough."""
+    global last_image_prune
+    with image_worker_lock:
+        if last_image_prune is not None and time.monotonic() - last_image_prune < IMAGE_PRUNE_INTERVAL_SECONDS:
+            return
+        last_image_prune = time.monotonic()
+    _queue_image_job(PRUNE_IMAGES_JOB)
+
+def referenced_images():
+    """Digests attached to a product in any location."""
+    digests = set()
+    for location in list_locations():
+        digests.update(row.get('image') for row in get_store(location).rows().values())
+    digests.discard(None)
+    return digests
+
+def prune_unreferenced_images(max_age_hours=UNREFERENCED_IMAGE_HOURS):
+    """Delete stored images (with their variants) that no product references
+    and that are older than ``max_age_hours``, i.e. scans never attached.
+    Returns the number of images removed."""
+    if not images_dir().is_dir():
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    referenced = referenced_images()
+    removed = 0
+    for original in images_dir().glob('*/*-original.*'):
+        digest = original.name.split('-', 1)[0]
+        try:
+            if digest in referenced or original.stat().st_mtime > cutoff:
+                continue
+            for path in original.parent.glob(f"{digest}-*"):
+                path.unlink()
+        except OSError as e:
+            print(f"Failed to remove image {digest}: {e}")
+            continue
+        removed += 1
+    return removed
+
+def _image_worker_loop():
+    while True:
+        job = image_jobs.get()
+        if job is None:
+            image_jobs.task_done()
+            return
+        try:
+            if job == PRUNE_IMAGES_JOB:
+                prune_unreferenced_images()
+            else:
+                generate_image_variants(job)
+        except Exception as e:
+            print(f"Failed to process image job {job}: {e}")
+        finally:
+            image_jobs.task_done()
+
+@atexit.register
+def _stop_image_worker():
+    # Let the job in progress finish; OpenCV aborts if torn down mid-encode
+    if image_worker is not None and image_worker.is_alive():
+        image_jobs.put(None)
+        image_worker.join(timeout=IMAGE_WORKER_SHUTDOWN_SECONDS)
+
+def generate_image_variants(digest, names=None):
+    """Render the missing variants of an image (all, or just ``names``)."""
+    original = original_image_path(digest)
+    if original is None:
+        return
+    image = None
+    for name in names or IMAGE_VARIANTS:
+        size, extension, params = IMAGE_VARIANTS[name]
+        path = _image_path(digest, name)
+        if path.exists():
+            continue
+        if image is None:
+            image = cv2.imdecode(np.fromfile(str(original), np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                print(f"Unreadable image {original}")
+                return
+        height, width = image.shape[:2]
+        scale = min(1.0, size / max(height, width))
+        resized = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                             interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+        ok, encoded = cv2.imencode(f".{extension}", resized, params)
+        if not ok:
+            continue
+        # Per thread: a request may render the variant while the worker does
+        temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        encoded.tofile(str(temp_path))
+        os.replace(temp_path, path)
 
 def calculate_urgency(expiry_date):
     today = datetime.now().date()
@@ -132,11 +850,16 @@ def send_sms_alert(product):
     if not settings.get('phone_number'):
         return False
     
+    location = product.get('location')
+    where = f" at {location}" if location and location != DEFAULT_LOCATION else ''
+    
     try:
         client = Client(config['account_sid'], config['auth_token'])
+        if TWILIO_API_URL:
+            client.api.base_url = TWILIO_API_URL
         
         message = client.messages.create(
-            body=f"ALERT: Product '{product['name']}' ({product['quantity']} {product['unit']}) is expiring in {product['status_text'].replace('Expires in ', '').replace(' days', '')} days!",
+            body=f"ALERT: Product '{product['name']}' ({product['quantity']} {product['unit']}){where} is expiring in {product['status_text'].replace('Expires in ', '').replace(' days', '')} days!",
             from_=config['twilio_number'],
             to=settings['phone_number']
         )
@@ -145,15 +868,11 @@ def send_sms_alert(product):
         print(f"Failed to send SMS: {e}")
         return False
 
-def check_expiry_alerts():
-    products = load_products()
-    settings = load_settings()
-    alert_days = settings.get('alert_days', 3)
+def _scan_location_alerts(location, alert_days):
     alerted_products = []
-    
-    for product in products:
+    today = datetime.now().date()
+    for product in load_products(location):
         expiry_date = product['expiry_date']
-        today = datetime.now().date()
         try:
             days_remaining = (expiry_date - today).days
         except TypeError:
@@ -164,12 +883,26 @@ def check_expiry_alerts():
             product_copy = product.copy()
             product_copy.update({
                 'urgency': urgency,
-                'status_text': status_text
+                'status_text': status_text,
+                'location': location
             })
             if send_sms_alert(product_copy):
                 alerted_products.append(product['id'])
     
-    return alerted_products
+    return [(location, product_id) for product_id in alerted_products]
+
+def check_expiry_alerts(locations=None):
+    """Send expiry SMS alerts, scanning the location shards in parallel.
+    Returns (location, product id) pairs for the alerts that were sent."""
+    settings = load_settings()
+    alert_days = settings.get('alert_days', 3)
+    locations = locations or list_locations()
+    if len(locations) == 1:
+        return _scan_location_alerts(locations[0], alert_days)
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(SHARD_WORKERS, len(locations)))) as pool:
+        shards = pool.map(lambda location: _scan_location_alerts(location, alert_days), locations)
+        return [alert for shard in shards for alert in shard]
 
 def query_ai_assistant(prompt, products):
     settings = load_settings()
@@ -231,7 +964,7 @@ def query_ai_assistant(prompt, products):
     
     try:
         response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
+            OPENROUTER_API_URL,
             headers=headers,
             json=payload,
             timeout=30
@@ -257,45 +990,551 @@ def query_ai_assistant(prompt, products):
     except Exception as e:
         return {"error": f"Error communicating with AI service: {str(e)}"}, False
 
-@app.route('/')
+# Local command parser. Common assistant commands are understood with a few
+# regular expressions and answered (or turned into the same action payloads
+# the LLM path produces) without a round trip to OpenRouter; anything it
+# can't parse returns None and goes to query_ai_assistant().
+UNIT_ALIASES = {
+    'kg': 'kg', 'kgs': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'g': 'g', 'gm': 'g', 'gms': 'g', 'gram': 'g', 'grams': 'g',
+    'l': 'l', 'ltr': 'l', 'litre': 'l', 'litres': 'l', 'liter': 'l', 'liters': 'l',
+    'ml': 'ml',
+    'pcs': 'pcs', 'pc': 'pcs', 'piece': 'pcs', 'pieces': 'pcs',
+    'box': 'box', 'boxes': 'box',
+    'pack': 'pack', 'packs': 'pack', 'packet': 'pack', 'packets': 'pack',
+}
+# Counting words that multiply the number in front of them ('1 dozen eggs')
+COUNT_WORDS = {'dozen': 12, 'dozens': 12, 'pair': 2, 'pairs': 2}
+DATE_PATTERN = r"(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{4}|today|tomorrow|in\s+\d+\s+(?:days?|weeks?|months?))"
+EXPIRY_CLAUSE = re.compile(r"\b(?:expir\w*|exp|best\s+before|use\s+by)\b\s*(?:date\s*)?(?:on|is|of|:|=)?\s*" + DATE_PATTERN, re.I)
+MANUFACTURE_CLAUSE = re.compile(r"\b(?:made|manufactured|mfg|mfd|packed)\b\s*(?:date\s*)?(?:on|is|of|:|=)?\s*" + DATE_PATTERN, re.I)
+ADD_COMMAND = re.compile(r"^(?:add|insert|create|stock)\s+(?P<body>.+)$", re.I)
+DELETE_COMMAND = re.compile(r"^(?:delete|remove|discard|drop)\s+(?:the\s+)?(?P<target>.+)$", re.I)
+UPDATE_FIELD = r"(?P<field>quantity|qty|stock|expiry(?:\s+date)?|expiration(?:\s+date)?|manufacture(?:\s+date)?|unit|name)"
+UPDATE_COMMANDS = [
+    re.compile(r"^(?:update|set|change|make)\s+(?:the\s+)?" + UPDATE_FIELD + r"\s+(?:of|for)\s+(?P<target>.+?)\s+to\s+(?P<value>.+)$", re.I),
+    re.compile(r"^(?:update|set|change|make)\s+(?P<target>.+?)(?:'s)?\s+" + UPDATE_FIELD + r"\s+to\s+(?P<value>.+)$", re.I),
+    re.compile(r"^rename\s+(?P<target>.+?)\s+to\s+(?P<value>.+)$", re.I),
+]
+EXPIRY_WINDOW = re.compile(r"\b(?:within|in|next|over)\s+(?:the\s+)?(?:next\s+)?(\d+)\s+(days?|weeks?|months?)\b", re.I)
+MOVEMENT_QUERY = re.compile(r"\b(expired|wasted|sold|restocked)\b.*\b(?:last|past)\s+(\d+)\s+(days?|weeks?|months?)\b", re.I)
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+QUESTION_WORDS = re.compile(r"^(?:how\s+many|count|number\s+of|list|which|what|show|any)\b", re.I)
+# Everything an inventory question may contain; any other word ('what should
+# I do with expired milk') means it's for the LLM
+QUERY_VOCABULARY = frozenset("""
+    how many count number of list which what show me any all the my our there
+    products product items item units unit stock inventory in we do have
+    is are will be get going to that already expire expires expiring expired
+    within next over this last past day days week weeks month months today
+    tomorrow soon sold wasted restocked
+""".split())
+MULTIPLE_ITEMS = re.compile(r"(?:,|&|\b(?:and|plus)\b)\s*\d", re.I)
+
+def parse_command_date(text, today=None):
+    """Parse YYYY-MM-DD, DD/MM/YYYY, today, tomorrow or 'in N days/weeks/months'."""
+    today = today or datetime.now().date()
+    text = text.strip().lower()
+    if text == 'today':
+        return today
+    if text == 'tomorrow':
+        return today + timedelta(days=1)
+    relative = re.fullmatch(r"in\s+(\d+)\s+(day|week|month)s?", text)
+    if relative:
+        return today + timedelta(days=int(relative.group(1)) * {'day': 1, 'week': 7, 'month': 30}[relative.group(2)])
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _clean_name(text):
+    text = re.sub(r"\b(?:of|with|and|that|which)\s*$", '', text.strip(' ,.;:-"\''), flags=re.I)
+    return re.sub(r'\s+', ' ', text).strip(' ,.;:-"\'')
+
+def _split_quantity(text):
+    """Split '5 kg rice', '2 milk', '1 dozen eggs', 'rice 5kg' or 'rice x5' into
+    (quantity, unit, name). Returns None when the count can't be told apart
+    from the name, rather than guessing 1 with a number left in the name."""
+    leading = re.match(r"^(\d+)\s*([a-z]+)\b\s*(.*)$", text, re.I)
+    if leading:
+        quantity, word, rest = int(leading.group(1)), leading.group(2), leading.group(3)
+        unit = UNIT_ALIASES.get(word.lower())
+        if unit or word.lower() == 'of':
+            name = re.sub(r"^of\s+", '', rest, flags=re.I)
+        elif word.lower() in COUNT_WORDS:
+            quantity *= COUNT_WORDS[word.lower()]
+            name = re.sub(r"^of\s+", '', rest, flags=re.I)
+        else:
+            # Not a unit ('2 milk', '5 bottles of water'): the word starts the name
+            name = f"{word} {rest}"
+        name = _clean_name(name)
+        return (quantity, unit, name) if name else None
+    trailing = re.match(r"^(.*?)\s*(?:x\s*)?(\d+)\s*([a-z]+)?$", text, re.I)
+    if trailing and trailing.group(1).strip():
+        unit = UNIT_ALIASES.get((trailing.group(3) or '').lower())
+        if unit or not trailing.group(3):
+            return int(trailing.group(2)), unit, _clean_name(trailing.group(1))
+    if re.search(r"\d", text):
+        return None
+    return 1, None, _clean_name(text)
+
+def _resolve_product(target, rows):
+    """Product id for 'product 4', '#4', 'id 4' or an unambiguous name.
+    ``rows`` is only called when a name has to be looked up."""
+    target = target.strip(' ,.;:"\'')
+    by_id = re.fullmatch(r"(?:(?:product|item)\s+)?(?:id\s*)?#?\s*(\d+)", target, re.I)
+    if by_id:
+        return int(by_id.group(1))
+    name = re.sub(r"^(?:product|item)\s+", '', target, flags=re.I).lower()
+    if not name:
+        return None
+    products = rows()
+    exact = [p['id'] for p in products if str(p.get('name', '')).lower() == name]
+    if len(exact) == 1:
+        return exact[0]
+    partial = [p['id'] for p in products if name in str(p.get('name', '')).lower()]
+    return partial[0] if len(partial) == 1 else None
+
+def add_action_payload(new_product):
+    return {
+        'response': f"Ready to add: {new_product['name']} (Qty: {new_product['quantity']} {new_product['unit']})",
+        'action': 'add',
+        'product': new_product
+    }
+
+def delete_action_payload(product_id):
+    return {
+        'response': f"Ready to delete product ID {product_id}",
+        'action': 'delete',
+        'product_id': product_id
+    }
+
+def update_action_payload(product_id, updates):
+    return {
+        'response': f"Ready to update product ID {product_id}",
+        'action': 'update',
+        'product_id': product_id,
+        'updates': updates
+    }
+
+def _parse_add(body):
+    today = datetime.now().date()
+    expiries = list(EXPIRY_CLAUSE.finditer(body))
+    # Several dates means several products ('milk expiring … and eggs expiring …'): leave it to the LLM
+    if len(expiries) != 1 or len(MANUFACTURE_CLAUSE.findall(body)) > 1:
+        return None
+    expiry = expiries[0]
+    expiry_date = parse_command_date(expiry.group(1), today)
+    manufacture = MANUFACTURE_CLAUSE.search(body)
+    manufacture_date = parse_command_date(manufacture.group(1), today) if manufacture else today
+    if not expiry_date or not manufacture_date:
+        return None
+    
+    rest = EXPIRY_CLAUSE.sub(' ', body)
+    rest = MANUFACTURE_CLAUSE.sub(' ', rest)
+    # '3 apples and 2 bananas' is several products too
+    if MULTIPLE_ITEMS.search(rest):
+        return None
+    split = _split_quantity(_clean_name(rest))
+    if not split or not split[2]:
+        return None
+    quantity, unit, name = split
+    return add_action_payload({
+        'name': name,
+        'quantity': quantity,
+        'unit': unit or 'pcs',
+        'manufacture_date': manufacture_date,
+        'expiry_date': expiry_date
+    })
+
+def _parse_update(match, rows):
+    product_id = _resolve_product(match.group('target'), rows)
+    if product_id is None:
+        return None
+    field = (match.groupdict().get('field') or 'name').lower().split()[0]
+    value = match.group('value').strip(' ,.;:"\'')
+    updates = {}
+    if field in ('quantity', 'qty', 'stock'):
+        amount = re.fullmatch(r"(\d+)\s*([a-z]+)?", value, re.I)
+        if not amount:
+            return None
+        updates['quantity'] = int(amount.group(1))
+        if amount.group(2):
+            unit = UNIT_ALIASES.get(amount.group(2).lower())
+            if not unit:
+                return None
+            updates['unit'] = unit
+    elif field in ('expiry', 'expiration', 'manufacture'):
+        date = parse_command_date(value)
+        if not date:
+            return None
+        updates['manufacture_date' if field == 'manufacture' else 'expiry_date'] = date.strftime('%Y-%m-%d')
+    elif field == 'unit':
+        unit = UNIT_ALIASES.get(value.lower())
+        if not unit:
+            return None
+        updates['unit'] = unit
+    else:
+        if not value:
+            return None
+        updates['name'] = value
+    return update_action_payload(product_id, updates)
+
+def _describe_products(rows, limit=10):
+    names = [f"{p['name']} ({p['quantity']} {p['unit']}, "
+             f"{datetime.strptime(p['expiry_date'], '%Y-%m-%d').strftime('%d/%m/%Y')})"
+             for p in rows[:limit]]
+    if len(rows) > limit:
+        names.append(f"and {len(rows) - limit} more")
+    return ', '.join(names)
+
+def _expiring_between(rows, first, last=None):
+    """Rows expiring between two dates (or before ``first`` alone). Stored
+    dates are ISO strings, so they compare as text without parsing every row."""
+    first = first.isoformat()
+    last = last.isoformat() if last else None
+    matches = []
+    for row in rows:
+        expiry = row.get('expiry_date')
+        if not isinstance(expiry, str) or not ISO_DATE.fullmatch(expiry):
+            continue
+        if (first <= expiry <= last) if last else expiry < first:
+            matches.append(row)
+    return matches
+
+def _parse_expiry_query(text, rows):
+    lowered = text.lower()
+    if not QUESTION_WORDS.match(lowered):
+        return None
+    if not QUERY_VOCABULARY.issuperset(re.findall(r"[a-z]+", lowered)):
+        return None
+    today = datetime.now().date()
+    
+    movement = MOVEMENT_QUERY.search(lowered)
+    if movement:
+        reason = {'expired': 'expired', 'wasted': 'waste', 'sold': 'sale', 'restocked': 'restock'}[movement.group(1)]
+        days = min(int(movement.group(2)) * {'d': 1, 'w': 7, 'm': 30}[movement.group(3)[0]], ROLLUP_RETENTION_DAYS)
+        units = get_store().ledger.window_totals(days)[reason]
+        return {'response': f"{units} units {movement.group(1)} in the last {days} days."}
+    
+    if 'expir' not in lowered:
+        if re.search(r"\bhow\s+many\s+(?:products|items)\b", lowered):
+            return {'response': f"There are {len(rows())} products in the inventory."}
+        return None
+    
+    if re.search(r"\bexpired\b|\balready\s+expir", lowered):
+        label, matches = 'are expired', _expiring_between(rows(), today)
+    else:
+        window = EXPIRY_WINDOW.search(lowered)
+        if window:
+            days = int(window.group(1)) * {'d': 1, 'w': 7, 'm': 30}[window.group(2)[0]]
+            label = f"expire within {days} days"
+            low, high = 0, days
+        elif 'today' in lowered:
+            label, low, high = 'expire today', 0, 0
+        elif 'tomorrow' in lowered:
+            label, low, high = 'expire tomorrow', 1, 1
+        elif 'this week' in lowered:
+            label, low, high = 'expire this week', 0, 7
+        elif 'this month' in lowered:
+            label, low, high = 'expire this month', 0, 30
+        elif 'soon' in lowered:
+            alert_days = load_settings().get('alert_days', 3)
+            label, low, high = f"expire within {alert_days} days", 0, alert_days
+        else:
+            return None
+        matches = _expiring_between(rows(), today + timedelta(days=low), today + timedelta(days=high))
+    
+    matches.sort(key=lambda p: p['expiry_date'])
+    if not matches:
+        return {'response': f"No products {label}."}
+    noun = 'product' if len(matches) == 1 else 'products'
+    verb = label if len(matches) != 1 else label.replace('are ', 'is ', 1).replace('expire ', 'expires ', 1)
+    return {'response': f"{len(matches)} {noun} {verb}: {_describe_products(matches)}."}
+
+def parse_local_command(command, rows):
+    """Answer a command locally, or return None to hand it to the LLM.
+    
+    ``rows`` returns the stored product rows (string dates); it's only called
+    when a name has to be resolved or an inventory question answered, so
+    commands by id never touch the inventory."""
+    text = re.sub(r'\s+', ' ', command).strip().rstrip('?.!')
+    
+    add = ADD_COMMAND.match(text)
+    if add:
+        return _parse_add(add.group('body'))
+    
+    for pattern in UPDATE_COMMANDS:
+        update = pattern.match(text)
+        if update:
+            return _parse_update(update, rows)
+    
+    delete = DELETE_COMMAND.match(text)
+    if delete:
+        product_id = _resolve_product(delete.group('target'), rows)
+        return delete_action_payload(product_id) if product_id is not None else None
+    
+    return _parse_expiry_query(text, rows)
+
+def with_urgency(product):
+    expiry_date = product['expiry_date']
+    urgency, status_text = calculate_urgency(expiry_date)
+    product_copy = product.copy()
+    product_copy.update({
+        'urgency': urgency,
+        'status_text': status_text,
+        'expiry_formatted': expiry_date.strftime('%d/%m/%Y'),
+        'manufacture_formatted': product['manufacture_date'].strftime('%d/%m/%Y')
+    })
+    return product_copy
+
+def sort_by_urgency(products):
+    return sorted(products, key=lambda x: (
+        {'expired': 0, 'urgent': 1, 'soon': 2, 'normal': 3}[x['urgency']],
+        x['expiry_date']
+    ))
+
+def cache_validators(*parts):
+    """ETag and Last-Modified for a view of the inventory.
+    
+    Urgency is relative to today, so the date is part of the ETag and
+    Last-Modified never predates midnight; ``parts`` carries whatever else the
+    view depends on (search query, settings, ...)."""
+    version, updated_at = get_inventory_version()
+    today = datetime.now().date()
+    etag = hashlib.md5(
+        json.dumps([version, today.isoformat(), *parts], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    
+    midnight = datetime.combine(today, datetime.min.time()).astimezone(timezone.utc)
+    last_modified = max(updated_at, midnight)
+    try:
+        settings_mtime = datetime.fromtimestamp(int(SETTINGS_FILE.stat().st_mtime), timezone.utc)
+        last_modified = max(last_modified, settings_mtime)
+    except OSError:
+        pass
+    return etag, last_modified
+
+def set_cache_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Cacheable, but always revalidated against the ETag
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def not_modified(etag, last_modified):
+    """Return a 304 response if the client's cached copy is still current."""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return set_cache_validators(Response(status=304), etag, last_modified)
+
+def location_route(rule, **options):
+    """Register a view for the default location at ``rule`` and for every
+    other location at ``/locations/<location>`` + ``rule``."""
+    def decorator(f):
+        app.add_url_rule(rule, view_func=f, **options)
+        app.add_url_rule('/locations/<location>' + rule, view_func=f, **options)
+        return f
+    return decorator
+
+@app.url_value_preprocessor
+def pull_location(endpoint, values):
+    location = (values or {}).pop('location', DEFAULT_LOCATION)
+    if not location_exists(location):
+        abort(404)
+    g.location = location
+
+@app.url_defaults
+def add_location(endpoint, values):
+    # Links built while serving a location stay inside that location
+    location = values.get('location', current_location())
+    if location == DEFAULT_LOCATION:
+        values.pop('location', None)
+    elif app.url_map.is_endpoint_expecting(endpoint, 'location'):
+        values['location'] = location
+
+class Overloaded(Exception):
+    def __init__(self, endpoint_class, status, retry_after):
+        super().__init__(endpoint_class)
+        self.endpoint_class = endpoint_class
+        self.status = status
+        self.retry_after = retry_after
+
+class Bulkhead:
+    """Caps the requests of one endpoint class that run at the same time.
+    
+    Up to ``max_in_flight`` run at once, up to ``queue_size`` more wait at most
+    ``queue_timeout`` seconds for a slot, and anything beyond that is turned
+    away immediately, so a slow class can't tie up every server thread."""
+    
+    def __init__(self, name, max_in_flight, queue_size, queue_timeout, retry_after):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+    
+    def acquire(self):
+        """Take a slot or raise Overloaded (429 when the queue is full, 503
+        when the wait timed out)."""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    raise Overloaded(self.name, 429, self.retry_after)
+                self.waiting += 1
+            try:
+                acquired = self.queue_timeout > 0 and self.slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self.lock:
+                    self.timed_out += 1
+                raise Overloaded(self.name, 503, self.retry_after)
+        with self.lock:
+            self.in_flight += 1
+    
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+    
+    def status(self):
+        with self.lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'queue_size': self.queue_size,
+                'queue_timeout': self.queue_timeout,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+bulkheads = {}
+bulkheads_lock = threading.Lock()
+
+def load_bulkhead_config():
+    """DEFAULT_BULKHEADS with per-class overrides from config.json's 'bulkheads'."""
+    overrides = load_config().get('bulkheads', {})
+    return {name: {**limits, **overrides.get(name, {})} for name, limits in DEFAULT_BULKHEADS.items()}
+
+def get_bulkhead(endpoint_class):
+    with bulkheads_lock:
+        if not bulkheads:
+            for name, limits in load_bulkhead_config().items():
+                bulkheads[name] = Bulkhead(name, **limits)
+        return bulkheads[endpoint_class]
+
+@contextmanager
+def concurrency_slot(endpoint_class):
+    bulkhead = get_bulkhead(endpoint_class)
+    bulkhead.acquire()
+    try:
+        yield
+    finally:
+        bulkhead.release()
+
+def limit_concurrency(endpoint_class):
+    """Run the view inside its endpoint class's bulkhead. The slot is freed
+    when the view returns, except for streamed responses, which keep it
+    until they are closed."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            bulkhead = get_bulkhead(endpoint_class)
+            bulkhead.acquire()
+            try:
+                response = make_response(f(*args, **kwargs))
+            except BaseException:
+                bulkhead.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(bulkhead.release)
+            else:
+                bulkhead.release()
+            return response
+        return wrapper
+    return decorator
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    response = jsonify({
+        'error': f"Too many {e.endpoint_class} requests in progress, try again shortly",
+        'retry_after': e.retry_after
+    })
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def load_server_config():
+    """DEFAULT_SERVER with overrides from config.json's 'server'. Without an
+    explicit thread count there is one thread per bulkhead slot and queue
+    place, plus a few for unlimited routes, so queued requests of one class
+    can't occupy the threads another class needs."""
+    server = {**DEFAULT_SERVER, **load_config().get('server', {})}
+    if not server.get('threads'):
+        server['threads'] = sum(limits['max_in_flight'] + limits['queue_size']
+                                for limits in load_bulkhead_config().values()) + 4
+    return server
+
+@location_route('/')
+@limit_concurrency('read')
 def index():
     try:
         settings = load_settings()
         search_query = request.args.get('search', '').lower()
-        products_with_urgency = []
+        locations = list_locations()
+        etag, last_modified = cache_validators('dashboard', search_query, settings, locations)
+        # Messages flashed before a redirect must be rendered, so never answer
+        # 304 then, nor let that page be revalidated later
+        if '_flashes' not in session:
+            cached = not_modified(etag, last_modified)
+            if cached is not None:
+                return cached
+        
+        # Read the version first: a change racing with the load then shows up
+        # as a newer event on /events instead of being missed
+        version, _ = get_inventory_version()
         products = load_products()
         
-        alerted_products = check_expiry_alerts()
+        alerted_products = check_expiry_alerts([current_location()])
         if alerted_products:
             flash(f"SMS alerts sent for {len(alerted_products)} products", 'success')
+        # Decided after the alert scan: a page showing its banner mustn't be
+        # served again as a 304
+        cacheable = '_flashes' not in session
         
-        for product in products:
-            expiry_date = product['expiry_date']
-            urgency, status_text = calculate_urgency(expiry_date)
-            product_copy = product.copy()
-            product_copy.update({
-                'urgency': urgency,
-                'status_text': status_text,
-                'expiry_formatted': expiry_date.strftime('%d/%m/%Y'),
-                'manufacture_formatted': product['manufacture_date'].strftime('%d/%m/%Y')
-            })
-            products_with_urgency.append(product_copy)
+        products_with_urgency = [with_urgency(product) for product in products]
         
         if search_query:
             products_with_urgency = [p for p in products_with_urgency 
                                    if search_query in p['name'].lower()]
         
-        sorted_products = sorted(products_with_urgency, key=lambda x: (
-            {'expired': 0, 'urgent': 1, 'soon': 2, 'normal': 3}[x['urgency']],
-            x['expiry_date']
-        ))
+        sorted_products = sort_by_urgency(products_with_urgency)
         
-        return render_template('index.html', 
+        response = make_response(render_template('index.html', 
                              products=sorted_products, 
                              now=datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
                              total_products=len(products),
                              search_query=search_query,
-                             settings=settings)
+                             inventory_version=version,
+                             location=current_location(),
+                             locations=locations,
+                             settings=settings))
+        if cacheable:
+            set_cache_validators(response, etag, last_modified)
+        return response
     except Exception as e:
         flash(f"Error loading page: {str(e)}", 'danger')
         return render_template('index.html', 
@@ -303,27 +1542,373 @@ def index():
                              now=datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
                              total_products=0,
                              search_query='',
+                             inventory_version=0,
+                             location=current_location(),
+                             locations=list_locations(),
                              settings=load_settings())
 
-@app.route('/add', methods=['POST'])
+@location_route('/api/products')
+@limit_concurrency('read')
+def list_products():
+    try:
+        search_query = request.args.get('search', '').lower()
+        etag, last_modified = cache_validators('products', search_query)
+        cached = not_modified(etag, last_modified)
+        if cached is not None:
+            return cached
+        
+        version, _ = get_inventory_version()
+        products = [with_urgency(product) for product in load_products()
+                    if search_query in product['name'].lower()]
+        for product in products:
+            for key in ['manufacture_date', 'expiry_date', 'added_date']:
+                product[key] = product[key].isoformat()
+        
+        response = jsonify({'version': version, 'products': sort_by_urgency(products)})
+        return set_cache_validators(response, etag, last_modified)
+    except Exception as e:
+        return jsonify({'error': f"Error listing products: {str(e)}"}), 500
+
+@location_route('/api/changes')
+@limit_concurrency('read')
+def list_changes():
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': 'since must be an integer inventory version'}), 400
+    try:
+        return jsonify(get_changes_since(since))
+    except Exception as e:
+        return jsonify({'error': f"Error listing changes: {str(e)}"}), 500
+
+def apply_product_fields(product, fields):
+    for key in ['name', 'unit']:
+        if key in fields:
+            product[key] = str(fields[key])
+    if 'quantity' in fields:
+        product['quantity'] = int(fields['quantity'])
+    for key in ['manufacture_date', 'expiry_date']:
+        if key in fields:
+            product[key] = datetime.strptime(fields[key], '%Y-%m-%d').date()
+    if fields.get('image'):
+        if not image_exists(fields['image']):
+            raise ValueError(f"Unknown image {fields['image']}")
+        product['image'] = fields['image']
+    return product
+
+@location_route('/api/sync', methods=['POST'])
+@limit_concurrency('crud')
+def sync_products():
+    """Apply a batch of offline-queued operations in one request.
+    
+    Body: ``{"since": <version>, "operations": [...]}``. Each operation is
+    ``{"op": "upsert", <product fields>}`` to add a product (optionally with a
+    ``client_ref`` echoed back next to the new id), ``{"op": "upsert", "id",
+    "base_version", <fields to change>}`` to update one, or ``{"op": "delete",
+    "id", "base_version"}``. Updates and deletes only apply while
+    ``base_version`` matches the product's version; otherwise the result is a
+    conflict carrying the server's row. When ``since`` is given the response
+    also holds the changes the device hasn't seen yet."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('operations', []), list):
+        return jsonify({'error': 'Expected a JSON object with an operations list'}), 400
+    since = data.get('since')
+    if since is not None and (not isinstance(since, int) or isinstance(since, bool)):
+        return jsonify({'error': 'since must be an integer inventory version'}), 400
+    
+    try:
+        settings = load_settings()
+        store = get_store()
+        with store.lock:
+            products = {p['id']: p for p in store.load()}
+            next_id = max(products, default=0) + 1
+            results = []
+            added = []
+            reasons = {}
+            
+            for index, op in enumerate(data.get('operations', [])):
+                result = {'index': index}
+                results.append(result)
+                if not isinstance(op, dict) or op.get('op') not in ('upsert', 'delete'):
+                    result.update({'status': 'invalid', 'message': "op must be 'upsert' or 'delete'"})
+                    continue
+                if 'client_ref' in op:
+                    result['client_ref'] = op['client_ref']
+                
+                if op['op'] == 'upsert' and op.get('id') is None:
+                    if not all(k in op for k in ['name', 'quantity', 'manufacture_date', 'expiry_date']):
+                        result.update({'status': 'invalid', 'message': "Missing required fields for adding a product"})
+                        continue
+                    try:
+                        product = apply_product_fields({'id': next_id, 'unit': 'pcs'}, op)
+                    except (ValueError, TypeError):
+                        result.update({'status': 'invalid', 'message': "Invalid quantity, date or image"})
+                        continue
+                    product['added_date'] = datetime.now().date()
+                    products[next_id] = product
+                    added.append(product)
+                    result.update({'status': 'applied', 'id': next_id})
+                    next_id += 1
+                    continue
+                
+                try:
+                    product_id = int(op.get('id'))
+                    base_version = int(op['base_version'])
+                except (KeyError, ValueError, TypeError):
+                    result.update({'status': 'invalid', 'message': "id and base_version are required"})
+                    continue
+                result['id'] = product_id
+                current = products.get(product_id)
+                if current is None:
+                    result.update({'status': 'not_found', 'message': "Product no longer exists"})
+                    continue
+                if current.get('version', 0) != base_version:
+                    result.update({'status': 'conflict', 'message': "Product changed since base_version"})
+                    continue
+                
+                reasons[product_id] = op.get('reason')
+                if op['op'] == 'delete':
+                    del products[product_id]
+                else:
+                    try:
+                        apply_product_fields(dict(current), op)
+                    except (ValueError, TypeError):
+                        result.update({'status': 'invalid', 'message': "Invalid quantity, date or image"})
+                        continue
+                    apply_product_fields(current, op)
+                result['status'] = 'applied'
+            
+            if any(r.get('status') == 'applied' for r in results):
+                if not store.save(list(products.values()), reasons):
+                    raise Exception("Failed to save products")
+            
+            version, _ = store.version()
+            rows = store.rows()
+            for result in results:
+                if result.get('status') in ('applied', 'conflict') and result['id'] in rows:
+                    result['product'] = rows[result['id']]
+            changes = store.changes_since(since) if since is not None else None
+        
+        alert_days = settings.get('alert_days', 3)
+        for product in added:
+            if (product['expiry_date'] - datetime.now().date()).days <= alert_days:
+                urgency, status_text = calculate_urgency(product['expiry_date'])
+                send_sms_alert({**product, 'urgency': urgency, 'status_text': status_text})
+        
+        response = {'version': version, 'results': results}
+        if changes is not None:
+            response['changes'] = changes
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': f"Error syncing products: {str(e)}"}), 500
+
+def _analytics_window():
+    days = request.args.get('days', 30, type=int)
+    if not days or not 1 <= days <= ROLLUP_RETENTION_DAYS:
+        return None
+    return days
+
+@location_route('/api/analytics')
+@limit_concurrency('read')
+def movement_analytics():
+    """Units sold, wasted, restocked and expired over the last ``days`` days."""
+    days = _analytics_window()
+    if days is None:
+        return jsonify({'error': f"days must be between 1 and {ROLLUP_RETENTION_DAYS}"}), 400
+    try:
+        store = get_store()
+        with store.lock:
+            return jsonify({
+                'window_days': days,
+                'totals': store.ledger.window_totals(days),
+                'daily': store.ledger.daily_totals(days)
+            })
+    except Exception as e:
+        return jsonify({'error': f"Error loading analytics: {str(e)}"}), 500
+
+@location_route('/api/analytics/at-risk')
+@limit_concurrency('read')
+def expiry_risk():
+    """Products predicted to expire before being used up."""
+    days = _analytics_window()
+    if days is None:
+        return jsonify({'error': f"days must be between 1 and {ROLLUP_RETENTION_DAYS}"}), 400
+    try:
+        return jsonify({'window_days': days, 'products': predict_expiry_waste(days=days)})
+    except Exception as e:
+        return jsonify({'error': f"Error predicting expiry risk: {str(e)}"}), 500
+
+@location_route('/attach_image/<int:product_id>', methods=['POST'])
+@limit_concurrency('crud')
+def attach_image(product_id):
+    """Attach an uploaded image file, or an already stored image digest."""
+    try:
+        upload = request.files.get('image')
+        if upload:
+            digest = store_image(upload.read())
+            if not digest:
+                return jsonify({'success': False, 'message': "Unsupported image format"}), 400
+        else:
+            digest = (request.get_json(silent=True) or request.form).get('image')
+            if not image_exists(digest):
+                return jsonify({'success': False, 'message': "Unknown image"}), 404
+        
+        store = get_store()
+        with store.lock:
+            products = store.load()
+            product = next((p for p in products if p['id'] == product_id), None)
+            if not product:
+                return jsonify({'success': False, 'message': "Product not found"}), 404
+            product['image'] = digest
+            if not store.save(products):
+                raise Exception("Failed to save products")
+        
+        return jsonify({'success': True, 'image': digest,
+                        'thumbnail': url_for('product_image', digest=digest, variant='thumb.webp')})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f"Error attaching image: {str(e)}"}), 500
+
+@app.route('/images/<digest>/<variant>')
+@limit_concurrency('read')
+def product_image(digest, variant):
+    if variant == 'original':
+        path = original_image_path(digest)
+    elif variant in IMAGE_VARIANTS and image_exists(digest):
+        path = _image_path(digest, variant)
+        if not path.exists():
+            # Not rendered yet: render just this one now (a single resize)
+            # rather than sending the full-size original, and queue the rest
+            generate_image_variants(digest, [variant])
+            queue_image_variants(digest)
+            if not path.exists():
+                path = None
+    else:
+        path = None
+    if path is None:
+        abort(404)
+    
+    response = send_file(path, max_age=IMAGE_CACHE_SECONDS)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/bulkheads')
+def bulkhead_status():
+    return jsonify({name: get_bulkhead(name).status() for name in DEFAULT_BULKHEADS})
+
+@app.route('/api/search')
+@limit_concurrency('read')
+def search_all_locations():
+    """Search across every location (or ``?locations=a,b``) at once."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No search query provided'}), 400
+    locations = [l for l in request.args.get('locations', '').split(',') if l] or None
+    if locations and not all(location_exists(l) for l in locations):
+        return jsonify({'error': 'Unknown location'}), 404
+    try:
+        products = search_products(query, locations)
+        for product in products:
+            for key in ['manufacture_date', 'expiry_date', 'added_date']:
+                product[key] = product[key].isoformat()
+        return jsonify({'query': query, 'products': products})
+    except Exception as e:
+        return jsonify({'error': f"Error searching products: {str(e)}"}), 500
+
+@app.route('/locations', methods=['GET', 'POST'])
+@limit_concurrency('crud')
+def manage_locations():
+    if request.method == 'GET':
+        return jsonify({'default': DEFAULT_LOCATION, 'locations': [
+            {'location': location, 'version': get_inventory_version(location)[0]}
+            for location in list_locations()
+        ]})
+    
+    data = request.get_json(silent=True) or request.form
+    try:
+        location = create_location(data.get('name', ''))
+    except ValueError as e:
+        if not request.is_json:
+            flash(str(e), 'danger')
+            return redirect(url_for('index'))
+        return jsonify({'error': str(e)}), 400
+    
+    if request.is_json:
+        return jsonify({'location': location}), 201
+    flash(f"Location '{location}' ready", 'success')
+    return redirect(url_for('index', location=location))
+
+@location_route('/events')
+@limit_concurrency('stream')
+def inventory_events():
+    """Server-Sent Events stream of changed product rows.
+    
+    A ``version`` event is sent on (re)connect; every change then arrives as an
+    ``inventory`` event with the new version, the rendered rows and the
+    deleted ids. Clients that see a version gap or ``reload`` re-fetch the page."""
+    location = current_location()
+    
+    def stream():
+        # Subscribe only once the body is iterated: a response that is never
+        # iterated (HEAD, early disconnect) never runs the finally below
+        subscriber = queue.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        entry = (location, subscriber)
+        event_subscribers.append(entry)
+        try:
+            version, _ = get_inventory_version(location)
+            yield f"retry: 5000\nevent: version\ndata: {version}\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=EVENTS_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                payload = {'version': event['version'], 'deleted': event.get('deleted', [])}
+                if event.get('reload'):
+                    payload['reload'] = True
+                rows = []
+                for row in event.get('changed', []):
+                    try:
+                        product = with_urgency(parse_product_dates(dict(row)))
+                    except (KeyError, ValueError):
+                        continue
+                    rows.append({
+                        'id': product['id'],
+                        'name': product['name'],
+                        'html': render_template('_product_row.html', product=product)
+                    })
+                payload['rows'] = rows
+                yield f"id: {event['version']}\nevent: inventory\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            event_subscribers.remove(entry)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@location_route('/add', methods=['POST'])
+@limit_concurrency('crud')
 def add_product():
     try:
-        products = load_products()
-        new_id = max((p['id'] for p in products), default=0) + 1
-        
-        product = {
-            'id': new_id,
-            'name': request.form['name'],
-            'quantity': int(request.form['quantity']),
-            'unit': request.form['unit'],
-            'manufacture_date': datetime.strptime(request.form['manufacture_date'], '%Y-%m-%d').date(),
-            'expiry_date': datetime.strptime(request.form['expiry_date'], '%Y-%m-%d').date(),
-            'added_date': datetime.now().date()
-        }
-        
-        products.append(product)
-        if not save_products(products):
-            raise Exception("Failed to save products")
+        store = get_store()
+        with store.lock:
+            products = store.load()
+            new_id = max((p['id'] for p in products), default=0) + 1
+        
+            product = {
+                'id': new_id,
+                'name': request.form['name'],
+                'quantity': int(request.form['quantity']),
+                'unit': request.form['unit'],
+                'manufacture_date': datetime.strptime(request.form['manufacture_date'], '%Y-%m-%d').date(),
+                'expiry_date': datetime.strptime(request.form['expiry_date'], '%Y-%m-%d').date(),
+                'added_date': datetime.now().date()
+            }
+            # Scan captured by /detect_item for this product, if any
+            if image_exists(request.form.get('image')):
+                product['image'] = request.form['image']
+        
+            products.append(product)
+            if not store.save(products):
+                raise Exception("Failed to save products")
         
         expiry_date = product['expiry_date']
         today = datetime.now().date()
@@ -341,62 +1926,68 @@ def add_product():
                 flash(f"Product added and SMS alert sent for {product['name']}", 'success')
         
         flash(f"Product '{product['name']}' added successfully", 'success')
-        return redirect('/')
+        return redirect(url_for('index'))
     except KeyError as e:
         flash(f"Missing required field: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
     except ValueError as e:
         flash(f"Invalid data format: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
     except Exception as e:
         flash(f"Error adding product: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
 
-@app.route('/delete/<int:product_id>')
+@location_route('/delete/<int:product_id>')
+@limit_concurrency('crud')
 def delete_product(product_id):
     try:
-        products = load_products()
-        product_to_delete = next((p for p in products if p['id'] == product_id), None)
+        store = get_store()
+        with store.lock:
+            products = store.load()
+            product_to_delete = next((p for p in products if p['id'] == product_id), None)
         
-        if not product_to_delete:
-            flash("Product not found", 'danger')
-            return redirect('/')
+            if not product_to_delete:
+                flash("Product not found", 'danger')
+                return redirect(url_for('index'))
             
-        products = [p for p in products if p['id'] != product_id]
+            products = [p for p in products if p['id'] != product_id]
         
-        if not save_products(products):
-            raise Exception("Failed to save products")
+            if not store.save(products, reasons={product_id: request.args.get('reason')}):
+                raise Exception("Failed to save products")
             
         flash(f"Product '{product_to_delete['name']}' deleted successfully", 'success')
-        return redirect('/')
+        return redirect(url_for('index'))
     except Exception as e:
         flash(f"Error deleting product: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
 
-@app.route('/update/<int:product_id>', methods=['POST'])
+@location_route('/update/<int:product_id>', methods=['POST'])
+@limit_concurrency('crud')
 def update_product(product_id):
     try:
-        products = load_products()
-        product_found = None
+        store = get_store()
+        with store.lock:
+            products = store.load()
+            product_found = None
         
-        for product in products:
-            if product['id'] == product_id:
-                product_found = product
-                break
+            for product in products:
+                if product['id'] == product_id:
+                    product_found = product
+                    break
         
-        if not product_found:
-            flash("Product not found", 'danger')
-            return redirect('/')
+            if not product_found:
+                flash("Product not found", 'danger')
+                return redirect(url_for('index'))
             
-        # Update all fields including dates
-        product_found['name'] = request.form['name']
-        product_found['quantity'] = int(request.form['quantity'])
-        product_found['unit'] = request.form['unit']
-        product_found['manufacture_date'] = datetime.strptime(request.form['manufacture_date'], '%Y-%m-%d').date()
-        product_found['expiry_date'] = datetime.strptime(request.form['expiry_date'], '%Y-%m-%d').date()
-        
-        if not save_products(products):
-            raise Exception("Failed to save products")
+            # Update all fields including dates
+            product_found['name'] = request.form['name']
+            product_found['quantity'] = int(request.form['quantity'])
+            product_found['unit'] = request.form['unit']
+            product_found['manufacture_date'] = datetime.strptime(request.form['manufacture_date'], '%Y-%m-%d').date()
+            product_found['expiry_date'] = datetime.strptime(request.form['expiry_date'], '%Y-%m-%d').date()
+        
+            if not store.save(products, reasons={product_id: request.form.get('reason')}):
+                raise Exception("Failed to save products")
             
         # Recalculate urgency after update
         expiry_date = product_found['expiry_date']
@@ -405,27 +1996,29 @@ def update_product(product_id):
         product_found['status_text'] = status_text
         
         flash("Product updated successfully", 'success')
-        return redirect('/')
+        return redirect(url_for('index'))
     except ValueError as e:
         flash(f"Invalid data format: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
     except Exception as e:
         flash(f"Error updating product: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
 
 @app.route('/change_theme', methods=['POST'])
+@limit_concurrency('crud')
 def change_theme():
     try:
         settings = load_settings()
         settings['theme'] = request.form['theme']
         if not save_settings(settings):
             raise Exception("Failed to save settings")
-        return redirect('/')
+        return redirect(url_for('index'))
     except Exception as e:
         flash(f"Error changing theme: {str(e)}", 'danger')
-        return redirect('/')
+        return redirect(url_for('index'))
 
 @app.route('/settings', methods=['GET', 'POST'])
+@limit_concurrency('crud')
 def manage_settings():
     try:
         settings = load_settings()
@@ -441,7 +2034,7 @@ def manage_settings():
                 raise Exception("Failed to save settings")
                 
             flash("Settings saved successfully", 'success')
-            return redirect('/')
+            return redirect(url_for('index'))
         
         return render_template('settings.html', settings=settings)
     except ValueError:
@@ -451,15 +2044,24 @@ def manage_settings():
         flash(f"Error loading settings: {str(e)}", 'danger')
         return redirect('/settings')
 
-@app.route('/ai_command', methods=['POST'])
+# No decorator: the local parse runs in the read class and the LLM fallback
+# in the ai class, without holding a read slot while waiting on the LLM
+@location_route('/ai_command', methods=['POST'])
 def handle_ai_command():
     try:
         command = request.form.get('command', '').strip()
         if not command:
             return jsonify({'error': 'No command provided'}), 400
         
-        products = load_products()
-        ai_response, success = query_ai_assistant(command, products)
+        store = get_store()
+        with concurrency_slot('read'):
+            local_response = parse_local_command(command, lambda: list(store.rows().values()))
+        if local_response is not None:
+            return jsonify(local_response)
+        
+        with concurrency_slot('ai'):
+            products = load_products()
+            ai_response, success = query_ai_assistant(command, products)
         
         if not success:
             return jsonify(ai_response), 400
@@ -497,55 +2099,46 @@ def handle_ai_command():
                             'manufacture_date': manufacture_date,
                             'expiry_date': expiry_date
                         }
-                        return jsonify({
-                            'response': f"Ready to add: {new_product['name']} (Qty: {new_product['quantity']} {new_product['unit']})",
-                            'action': 'add',
-                            'product': new_product
-                        })
+                        return jsonify(add_action_payload(new_product))
                     elif action_data['action'] == 'delete' and 'id' in action_data:
-                        return jsonify({
-                            'response': f"Ready to delete product ID {action_data['id']}",
-                            'action': 'delete',
-                            'product_id': action_data['id']
-                        })
+                        return jsonify(delete_action_payload(action_data['id']))
                     elif action_data['action'] == 'update' and 'id' in action_data:
-                        return jsonify({
-                            'response': f"Ready to update product ID {action_data['id']}",
-                            'action': 'update',
-                            'product_id': action_data['id'],
-                            'updates': action_data.get('updates', {})
-                        })
+                        return jsonify(update_action_payload(action_data['id'], action_data.get('updates', {})))
         
         except Exception as e:
             print(f"Error processing AI response: {str(e)}")
         
         return jsonify({'response': ai_response.get('response', 'No response from AI')})
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({'error': f"Error processing AI command: {str(e)}"}), 500
 
-@app.route('/execute_ai_action', methods=['POST'])
+@location_route('/execute_ai_action', methods=['POST'])
+@limit_concurrency('crud')
 def execute_ai_action():
     try:
         action = request.form.get('action')
         
         if action == 'add':
-            products = load_products()
-            new_id = max((p['id'] for p in products), default=0) + 1
-            
             try:
-                product = {
-                    'id': new_id,
-                    'name': request.form['name'],
-                    'quantity': int(request.form['quantity']),
-                    'unit': request.form.get('unit', 'pcs'),
-                    'manufacture_date': datetime.strptime(request.form['manufacture_date'], '%Y-%m-%d').date(),
-                    'expiry_date': datetime.strptime(request.form['expiry_date'], '%Y-%m-%d').date(),
-                    'added_date': datetime.now().date()
-                }
-                
-                products.append(product)
-                if not save_products(products):
-                    raise Exception("Failed to save products")
+                store = get_store()
+                with store.lock:
+                    products = store.load()
+                    new_id = max((p['id'] for p in products), default=0) + 1
+                    product = {
+                        'id': new_id,
+                        'name': request.form['name'],
+                        'quantity': int(request.form['quantity']),
+                        'unit': request.form.get('unit', 'pcs'),
+                        'manufacture_date': datetime.strptime(request.form['manufacture_date'], '%Y-%m-%d').date(),
+                        'expiry_date': datetime.strptime(request.form['expiry_date'], '%Y-%m-%d').date(),
+                        'added_date': datetime.now().date()
+                    }
+                    
+                    products.append(product)
+                    if not store.save(products):
+                        raise Exception("Failed to save products")
                     
                 return jsonify({
                     'success': True, 
@@ -560,12 +2153,14 @@ def execute_ai_action():
         elif action == 'delete':
             try:
                 product_id = int(request.form['product_id'])
-                products = load_products()
-                product_name = next((p['name'] for p in products if p['id'] == product_id), 'Unknown')
-                products = [p for p in products if p['id'] != product_id]
+                store = get_store()
+                with store.lock:
+                    products = store.load()
+                    product_name = next((p['name'] for p in products if p['id'] == product_id), 'Unknown')
+                    products = [p for p in products if p['id'] != product_id]
                 
-                if not save_products(products):
-                    raise Exception("Failed to save products")
+                    if not store.save(products):
+                        raise Exception("Failed to save products")
                     
                 return jsonify({
                     'success': True, 
@@ -581,24 +2176,26 @@ def execute_ai_action():
             try:
                 product_id = int(request.form['product_id'])
                 updates = json.loads(request.form['updates'])
-                products = load_products()
-                product_found = False
+                store = get_store()
+                with store.lock:
+                    products = store.load()
+                    product_found = False
                 
-                for product in products:
-                    if product['id'] == product_id:
-                        for key, value in updates.items():
-                            if key in ['manufacture_date', 'expiry_date']:
-                                product[key] = datetime.strptime(value, '%Y-%m-%d').date()
-                            else:
-                                product[key] = value
-                        product_found = True
-                        break
+                    for product in products:
+                        if product['id'] == product_id:
+                            for key, value in updates.items():
+                                if key in ['manufacture_date', 'expiry_date']:
+                                    product[key] = datetime.strptime(value, '%Y-%m-%d').date()
+                                else:
+                                    product[key] = value
+                            product_found = True
+                            break
                 
-                if not product_found:
-                    return jsonify({'success': False, 'message': "Product not found"}), 404
+                    if not product_found:
+                        return jsonify({'success': False, 'message': "Product not found"}), 404
                     
-                if not save_products(products):
-                    raise Exception("Failed to save products")
+                    if not store.save(products):
+                        raise Exception("Failed to save products")
                     
                 return jsonify({
                     'success': True, 
@@ -621,6 +2218,7 @@ def execute_ai_action():
 
 
 @app.route('/detect_item', methods=['POST'])
+@limit_concurrency('ocr')
 def detect_item():
     try:
         import base64
@@ -638,6 +2236,9 @@ def detect_item():
         if frame is None:
             return jsonify({'error': 'Invalid image'}), 400
 
+        # Keep the scan so it can be attached to the product being added
+        image_digest = store_image(image_bytes)
+
         # Load EasyOCR once (cached)
         if not hasattr(detect_item, "reader"):
             detect_item.reader = easyocr.Reader(['en'], gpu=False)  # Add 'hi','fr' etc. if needed
@@ -668,6 +2269,7 @@ def detect_item():
         if not texts:
             return jsonify({
                 'name': '',
+                'image': image_digest,
                 'message': 'No text detected — try better lighting or closer photo'
             })
 
@@ -681,6 +2283,7 @@ def detect_item():
 
         return jsonify({
             'name': detected_name,
+            'image': image_digest,
             'message': 'Detected successfully'
         })
 
@@ -829,5 +2432,17 @@ def detect_item():
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
+@app.cli.command('check-alerts')
+def check_alerts_command():
+    """Scan every location for expiring products and send SMS alerts."""
+    alerted = check_expiry_alerts()
+    print(f"SMS alerts sent for {len(alerted)} products across {len(list_locations())} locations")
+
+@app.cli.command('prune-images')
+def prune_images_command():
+    """Delete stored images no product references (unattached scans)."""
+    removed = prune_unreferenced_images()
+    print(f"Removed {removed} unreferenced images older than {UNREFERENCED_IMAGE_HOURS} hours")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
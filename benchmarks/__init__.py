@@ -0,0 +1,7 @@
+"""Reproducible benchmark suite for the inventory app.
+
+Run with ``python -m benchmarks --help``. Every run works on a throwaway
+data directory filled with synthetic products, talks to local stand-ins
+for Twilio and OpenRouter, and prints a JSON report with throughput and
+latency percentiles per scenario so results can be diffed between versions.
+"""
@@ -0,0 +1,53 @@
+"""Command line entry point: ``python -m benchmarks``."""
+import argparse
+import json
+import sys
+
+from .runner import SCENARIOS, run
+
+
+def _int_list(value):
+    return [int(v.replace('_', '')) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark the inventory app against synthetic inventories.',
+    )
+    parser.add_argument('--sizes', type=_int_list, default=[1000, 10000, 100000],
+                        help='comma separated inventory sizes (default: 1000,10000,100000; '
+                             'up to 1000000 is supported)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=50,
+                        help='measured requests per scenario and size')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='unmeasured requests before each scenario')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--openrouter-delay', type=float, default=0.0,
+                        help='seconds the fake OpenRouter waits before answering')
+    parser.add_argument('--twilio-delay', type=float, default=0.0,
+                        help='seconds the fake Twilio waits before answering')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = run(args.sizes, scenarios, requests=args.requests, warmup=args.warmup,
+                 seed=args.seed, openrouter_delay=args.openrouter_delay,
+                 twilio_delay=args.twilio_delay)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
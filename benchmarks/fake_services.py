@@ -0,0 +1,96 @@
+"""Local stand-ins for the Twilio and OpenRouter HTTP APIs.
+
+Both servers run on 127.0.0.1 in a background thread, count the calls they
+receive and can add a fixed delay per response to model upstream latency.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        service = self.server.service
+        with service.lock:
+            service.calls += 1
+        if service.delay:
+            time.sleep(service.delay)
+        status, payload = service.respond(self.path, body)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeService:
+    """Base class; subclasses implement ``respond(path, body)``."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, path, body):
+        raise NotImplementedError
+
+
+class FakeTwilio(FakeService):
+    """Accepts Messages.json POSTs and answers like Twilio's REST API."""
+
+    def respond(self, path, body):
+        if not path.endswith('/Messages.json'):
+            return 404, {'message': 'Not found'}
+        return 201, {'sid': f"SM{self.calls:032d}", 'status': 'queued'}
+
+
+class FakeOpenRouter(FakeService):
+    """Answers chat completions with a fixed assistant action."""
+
+    def __init__(self, delay=0.0, content=None):
+        super().__init__(delay)
+        self.content = content or json.dumps({'action': 'delete', 'id': 1})
+
+    @property
+    def url(self):
+        return super().url + '/api/v1/chat/completions'
+
+    def respond(self, path, body):
+        return 200, {
+            'id': 'gen-bench',
+            'choices': [{'message': {'role': 'assistant', 'content': self.content}}],
+        }
@@ -0,0 +1,280 @@
+"""Drive the Flask app through its test client and collect latencies."""
+import base64
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .fake_services import FakeOpenRouter, FakeTwilio
+from .synthetic import NAMES, UNITS, write_products
+
+ROOT = Path(__file__).resolve().parent.parent
+UPLOADS_DIR = ROOT / 'static' / 'uploads'
+
+SCENARIOS = ['index', 'index_cached', 'search', 'add', 'update', 'ai_command', 'ai_command_llm', 'detect_item', 'delete']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    to_ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': to_ms(sum(values) / len(values)) if values else None,
+            'p50': to_ms(percentile(values, 50)),
+            'p95': to_ms(percentile(values, 95)),
+            'p99': to_ms(percentile(values, 99)),
+            'max': to_ms(values[-1]) if values else None,
+        },
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _product_form(rng):
+    today = datetime.now().date()
+    return {
+        'name': f"Bench {rng.choice(NAMES)}",
+        'quantity': str(rng.randint(1, 50)),
+        'unit': rng.choice(UNITS),
+        'manufacture_date': today.isoformat(),
+        'expiry_date': (today + timedelta(days=rng.randint(1, 365))).isoformat(),
+    }
+
+
+def _load_images():
+    images = []
+    for path in sorted(UPLOADS_DIR.glob('*.jpg')):
+        encoded = base64.b64encode(path.read_bytes()).decode()
+        images.append(f"data:image/jpeg;base64,{encoded}")
+    return images
+
+
+class Workload:
+    """One request per call for each scenario, against a shared state."""
+
+    def __init__(self, client, product_ids, rng):
+        self.client = client
+        self.rng = rng
+        self.live_ids = list(product_ids)
+        self.delete_queue = list(product_ids)
+        rng.shuffle(self.delete_queue)
+        self.images = _load_images()
+        self.etag = None
+
+    def index(self):
+        return self.client.get('/')
+
+    def index_cached(self):
+        # A dashboard revalidating its copy while nothing changed. Pages that
+        # flashed an SMS alert banner carry no ETag; then every view renders.
+        if self.etag is None:
+            with self.client.get('/') as response:
+                self.etag = response.headers.get('ETag', '')
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        return self.client.get('/', headers=headers)
+
+    def search(self):
+        return self.client.get('/', query_string={'search': self.rng.choice(NAMES).lower()})
+
+    def add(self):
+        return self.client.post('/add', data=_product_form(self.rng))
+
+    def update(self):
+        product_id = self.rng.choice(self.live_ids)
+        return self.client.post(f'/update/{product_id}', data=_product_form(self.rng))
+
+    def ai_command(self):
+        product_id = self.rng.choice(self.live_ids)
+        return self.client.post('/ai_command', data={'command': f"delete product {product_id}"})
+
+    def ai_command_llm(self):
+        # Not understood by the local parser, so it goes to (fake) OpenRouter
+        return self.client.post('/ai_command', data={'command': 'suggest a reorder plan for next week'})
+
+    def detect_item(self):
+        return self.client.post('/detect_item', json={'image': self.rng.choice(self.images)})
+
+    def delete(self):
+        product_id = self.delete_queue.pop()
+        self.live_ids.remove(product_id)
+        return self.client.get(f'/delete/{product_id}')
+
+    def skip_reason(self, scenario, requests):
+        if scenario == 'detect_item':
+            if importlib.util.find_spec('easyocr') is None:
+                return 'easyocr not installed'
+            if not self.images:
+                return f'no images in {UPLOADS_DIR}'
+        if scenario == 'delete' and len(self.delete_queue) < requests:
+            return 'inventory smaller than request count'
+        return None
+
+
+def run_scenario(workload, scenario, requests, warmup):
+    call = getattr(workload, scenario)
+    for _ in range(warmup):
+        call().close()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        response = call()
+        latencies.append(time.perf_counter() - t0)
+        # Streamed responses hold their concurrency slot until closed
+        response.close()
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+APP_PATHS = {
+    'DATA_DIR': '',
+    'DATA_FILE': 'products.json',
+    'SETTINGS_FILE': 'settings.json',
+    'CONFIG_FILE': 'config.json',
+    'INVENTORY_META_FILE': 'inventory_meta.json',
+}
+ENV_VARS = ('INVENTORY_DATA_DIR', 'TWILIO_API_URL', 'OPENROUTER_API_URL')
+
+
+@contextmanager
+def _app_environment(data_dir, twilio_url, openrouter_url):
+    """Import the app pointed at ``data_dir`` and the fake services, and put
+    everything back afterwards so a caller that imported it keeps working."""
+    saved_env = {name: os.environ.get(name) for name in ENV_VARS}
+    os.environ.update({
+        'INVENTORY_DATA_DIR': data_dir,
+        'TWILIO_API_URL': twilio_url,
+        'OPENROUTER_API_URL': openrouter_url,
+    })
+    app_module = importlib.import_module('app')
+    # The app reads these at import time; keep them in step if it was
+    # already imported by the caller.
+    saved = {name: getattr(app_module, name)
+             for name in (*APP_PATHS, 'TWILIO_API_URL', 'OPENROUTER_API_URL')}
+    saved_stores = dict(app_module.stores)
+    saved_bulkheads = dict(app_module.bulkheads)
+    try:
+        for name, filename in APP_PATHS.items():
+            setattr(app_module, name, Path(data_dir) / filename)
+        app_module.TWILIO_API_URL = twilio_url
+        app_module.OPENROUTER_API_URL = openrouter_url
+        # Drop state cached against the previous data directory
+        app_module.stores.clear()
+        app_module.bulkheads.clear()
+        yield app_module
+    finally:
+        # Let thumbnail and prune jobs finish before the directory goes away
+        app_module.image_jobs.join()
+        for name, value in saved.items():
+            setattr(app_module, name, value)
+        app_module.stores.clear()
+        app_module.stores.update(saved_stores)
+        app_module.bulkheads.clear()
+        app_module.bulkheads.update(saved_bulkheads)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _run_sizes(app_module, twilio, openrouter, sizes, scenarios, requests, warmup, seed):
+    _write_json(app_module.SETTINGS_FILE, {
+        **app_module.DEFAULT_SETTINGS,
+        'sms_alerts': True,
+        'phone_number': '+15550000000',
+        'ai_enabled': True,
+        'openrouter_api_key': 'bench-key',
+    })
+    _write_json(app_module.CONFIG_FILE, {
+        'account_sid': 'AC' + '0' * 32,
+        'auth_token': 'bench-token',
+        'twilio_number': '+15550000001',
+    })
+
+    results = []
+    for size in sizes:
+        products = write_products(app_module.DATA_FILE, size, seed=seed)
+        client = app_module.app.test_client(use_cookies=False)
+        workload = Workload(client, [p['id'] for p in products], random.Random(seed))
+        for scenario in scenarios:
+            twilio_before, openrouter_before = twilio.calls, openrouter.calls
+            reason = workload.skip_reason(scenario, requests + warmup)
+            if reason:
+                results.append({'size': size, 'scenario': scenario, 'skipped': reason})
+                continue
+            result = run_scenario(workload, scenario, requests, warmup)
+            result.update({
+                'size': size,
+                'scenario': scenario,
+                'upstream_calls': {
+                    'twilio': twilio.calls - twilio_before,
+                    'openrouter': openrouter.calls - openrouter_before,
+                },
+            })
+            results.append(result)
+    return results
+
+
+def run(sizes, scenarios, requests=50, warmup=2, seed=42,
+        openrouter_delay=0.0, twilio_delay=0.0):
+    """Run every scenario for every inventory size and return the report."""
+    with tempfile.TemporaryDirectory(prefix='inventory-bench-') as data_dir, \
+            FakeTwilio(delay=twilio_delay) as twilio, \
+            FakeOpenRouter(delay=openrouter_delay) as openrouter:
+        if str(ROOT) not in sys.path:
+            sys.path.insert(0, str(ROOT))
+        with _app_environment(data_dir, twilio.url, openrouter.url) as app_module:
+            results = _run_sizes(app_module, twilio, openrouter, sizes, scenarios,
+                                 requests, warmup, seed)
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'requests': requests,
+            'warmup': warmup,
+            'sizes': sizes,
+            'openrouter_delay': openrouter_delay,
+            'twilio_delay': twilio_delay,
+        },
+        'results': results,
+    }
@@ -0,0 +1,67 @@
+"""Synthetic products.json generator.
+
+Shelf lives are drawn from three product families (fresh, packaged and
+long-life goods) and the stock is spread over its life cycle, so a
+generated inventory has a realistic mix of expired, urgent, soon and
+normal items instead of everything expiring on the same day.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+NAMES = [
+    'Milk', 'Bread', 'Yogurt', 'Cheese', 'Butter', 'Eggs', 'Tomatoes', 'Spinach',
+    'Rice', 'Flour', 'Sugar', 'Lentils', 'Pasta', 'Cereal', 'Biscuits', 'Coffee',
+    'Tea', 'Honey', 'Olive Oil', 'Canned Beans', 'Soap', 'Shampoo', 'Detergent',
+    'Battery AA', 'Resistor 10k', 'Capacitor 100uF', 'LED Red', 'Fuse 5A',
+]
+BRANDS = ['Amul', 'Nestle', 'Tata', 'Fresh', 'Daily', 'Prime', 'Eco', 'Value', 'YF']
+UNITS = ['pcs', 'kg', 'g', 'l', 'ml', 'box']
+
+# (weight, min shelf life days, max shelf life days)
+FAMILIES = [
+    (0.30, 3, 14),      # fresh: dairy, bakery, produce
+    (0.50, 30, 365),    # packaged groceries
+    (0.20, 365, 1095),  # long-life goods and components
+]
+
+
+def _shelf_life(rng):
+    pick = rng.random()
+    for weight, low, high in FAMILIES:
+        if pick < weight:
+            return rng.randint(low, high)
+        pick -= weight
+    return rng.randint(FAMILIES[-1][1], FAMILIES[-1][2])
+
+
+def generate_products(count, seed=42, today=None):
+    """Return ``count`` product dicts in the on-disk (string date) format."""
+    rng = random.Random(seed)
+    today = today or datetime.now().date()
+    products = []
+    for product_id in range(1, count + 1):
+        shelf_life = _shelf_life(rng)
+        # Position in the life cycle; a little over 1.0 leaves ~8% already expired
+        age = int(shelf_life * rng.uniform(0.0, 1.08))
+        manufacture_date = today - timedelta(days=age)
+        expiry_date = manufacture_date + timedelta(days=shelf_life)
+        added_date = manufacture_date + timedelta(days=rng.randint(0, min(age, 7)))
+        products.append({
+            'id': product_id,
+            'name': f"{rng.choice(BRANDS)} {rng.choice(NAMES)} #{product_id}",
+            'quantity': rng.randint(1, 200),
+            'unit': rng.choice(UNITS),
+            'manufacture_date': manufacture_date.isoformat(),
+            'expiry_date': expiry_date.isoformat(),
+            'added_date': added_date.isoformat(),
+        })
+    return products
+
+
+def write_products(path, count, seed=42, today=None):
+    """Write a synthetic products.json to ``path`` and return the products."""
+    products = generate_products(count, seed=seed, today=today)
+    with open(path, 'w') as f:
+        json.dump(products, f, indent=2)
+    return products
@@ -0,0 +1,27 @@
+"""Production entry point: ``python serve.py``.
+
+Serves the app with Waitress instead of the Flask development server. Host,
+port and thread counts come from the 'server' section of data/config.json
+(see DEFAULT_SERVER in app.py); the per-endpoint concurrency limits come from
+its 'bulkheads' section.
+"""
+from waitress import serve
+
+from app import app, load_server_config
+
+
+def main():
+    server = load_server_config()
+    print(f"Serving on http://{server['host']}:{server['port']} with {server['threads']} threads")
+    serve(
+        app,
+        host=server['host'],
+        port=server['port'],
+        threads=server['threads'],
+        connection_limit=server['connection_limit'],
+        channel_timeout=server['channel_timeout'],
+    )
+
+
+if __name__ == '__main__':
+    main()